@@ -0,0 +1,154 @@
+"""Deduplicating backup store for save files.
+
+
+Copyright (c) 2022 Ali Farzanrad <ali_farzanrad@riseup.net>
+
+Permission to use, copy, modify, and distribute this software for any
+purpose with or without fee is hereby granted.
+
+THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+MERCHANTABILITY AND FITNESS.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+"""
+
+from hashlib import sha256
+from io import BytesIO
+from json import dump, load
+from os import replace
+from pathlib import Path
+from cp2077chunk import DataChunkTableChunk, HeaderChunk
+
+
+class BackupStore:
+    OBJECTS = "objects"
+    MANIFESTS = "manifests"
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def __len__(self):
+        return len(self.versions())
+
+    def versions(self):
+        try:
+            return self._versions()
+        except OSError:
+            return []
+
+    def manifest(self, version):
+        path = self.path / self.MANIFESTS / ("%d.json" % version)
+        with path.open(encoding="utf-8") as f:
+            return load(f)
+
+    def add(self, path):
+        with Path(path).open("rb") as f:
+            data = f.read()
+        parts = []
+        for start, end in self.split(data):
+            parts.append(self._put(data[start:end]))
+        versions = self.versions()
+        version = versions[-1] + 1 if versions else 1
+        manifest = {
+            "size": len(data),
+            "parts": [item[0] for item in parts],
+            "sizes": [item[1] for item in parts],
+        }
+        path = self.path / self.MANIFESTS / ("%d.json" % version)
+        self._write(path, manifest)
+        return version
+
+    def restore(self, version, path):
+        manifest = self.manifest(version)
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("wb") as f:
+            for name in manifest["parts"]:
+                f.write(self._object(name).read_bytes())
+        if tmp.stat().st_size != manifest["size"]:
+            tmp.unlink()
+            raise Exception("backup %d is damaged" % version)
+        replace(tmp, path)
+
+    def prune(self, count=None, size=None):
+        try:
+            versions = self._versions()
+        except OSError:
+            return
+        if not versions:
+            return
+        manifests = {i: self.manifest(i) for i in versions}
+        removed = False
+        while len(versions) > 1 and (
+            (count is not None and len(versions) > count)
+            or (size is not None and self._size(manifests) > size)
+        ):
+            path = self.path / self.MANIFESTS
+            (path / ("%d.json" % versions[0])).unlink()
+            del manifests[versions.pop(0)]
+            removed = True
+        if not removed:
+            return
+        used = set()
+        for manifest in manifests.values():
+            used.update(manifest["parts"])
+        for item in (self.path / self.OBJECTS).glob("*/*"):
+            if item.parent.name + item.name not in used:
+                item.unlink()
+
+    @staticmethod
+    def split(data):
+        stream = BytesIO(data)
+        try:
+            HeaderChunk.read(stream)
+            info = DataChunkTableChunk.read(stream).info
+        except Exception:
+            return [(0, len(data))]
+        res = []
+        prev = 0
+        for item in info:
+            end = item.offset + item.comp_len
+            if item.offset < prev or end > len(data):
+                return [(0, len(data))]
+            if item.offset > prev:
+                res.append((prev, item.offset))
+            res.append((item.offset, end))
+            prev = end
+        res.append((prev, len(data)))
+        return res
+
+    def _versions(self):
+        res = []
+        for item in (self.path / self.MANIFESTS).iterdir():
+            if item.suffix == ".json" and item.stem.isdigit():
+                res.append(int(item.stem))
+        return sorted(res)
+
+    def _object(self, name):
+        return self.path / self.OBJECTS / name[:2] / name[2:]
+
+    def _put(self, data):
+        name = sha256(data).hexdigest()
+        path = self._object(name)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(data)
+            replace(tmp, path)
+        return name, len(data)
+
+    def _size(self, manifests):
+        sizes = {}
+        for manifest in manifests.values():
+            sizes.update(zip(manifest["parts"], manifest["sizes"]))
+        return sum(sizes.values())
+
+    def _write(self, path, value):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            dump(value, f)
+        replace(tmp, path)
@@ -15,9 +15,12 @@ ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
 OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 """
 
+from array import array
 from collections import namedtuple
 from io import BytesIO
+from itertools import chain
 from struct import Struct
+from sys import byteorder
 
 uint32 = Struct("<I")
 pack32 = uint32.pack
@@ -266,6 +269,8 @@ class DataChunk(Chunk):
 
 class LZ4DataChunk(DataChunk):
     EMPTY = b"4ZLX" + bytes(4)
+    FAST, HIGH = 1, 9
+    LEVEL = FAST
 
     @property
     def comp_len(self):
@@ -276,43 +281,221 @@ class LZ4DataChunk(DataChunk):
         magiclen = len(self.MAGIC)
         return unpack32(self[magiclen : magiclen + 4])[0]
 
-    @property
-    def data(self):
-        res = bytearray()
+    @staticmethod
+    def compress(data, level=FAST):
+        src = bytes(data)
+        size = len(src)
+        res = bytearray(pack32(size))
+        append = res.append
         extend = res.extend
-        read = BytesIO(self).read
-        read(len(self.MAGIC) + 4)
-        while token := read(1):
-            last = (length := token[0] >> 4) + 240
-            while last == 255:
-                length += (last := read(1)[0])
-            extend(read(length))
-            if not (off := read(2)):
+        depth = 1 << level - 1 if level > 1 else 0
+        anchor = 0
+
+        def match_length(ip, ref, limit):
+            length = 4
+            step = 16
+            while length < limit:
+                n = min(step, limit - length)
+                a = ip + length
+                b = ref + length
+                if src[a : a + n] == src[b : b + n]:
+                    length += n
+                    step <<= 1
+                    continue
+                while n > 1:
+                    half = n >> 1
+                    if src[a : a + half] == src[b : b + half]:
+                        a += half
+                        b += half
+                        length += half
+                        n -= half
+                    else:
+                        n = half
                 break
-            off = off[0] + (off[1] << 8)
-            if off <= 0 or (off := len(res) - off) < 0:
+            return length
+
+        def emit(ip, off, length):
+            literals = ip - anchor
+            length -= 4
+            token = min(literals, 15) << 4 | min(length, 15)
+            append(token)
+            if literals >= 15:
+                extend(b"\xff" * ((literals - 15) // 255))
+                append((literals - 15) % 255)
+            extend(src[anchor:ip])
+            append(off & 255)
+            append(off >> 8)
+            if length >= 15:
+                extend(b"\xff" * ((length - 15) // 255))
+                append((length - 15) % 255)
+
+        mflimit = size - 12
+        matchlimit = size - 5
+        last = {}
+        if depth:
+            prev = [-1] * size
+            inserted = 0
+
+            def find(ip):
+                nonlocal inserted
+                for pos in range(inserted, ip):
+                    key = src[pos : pos + 4]
+                    prev[pos] = last.get(key, -1)
+                    last[key] = pos
+                inserted = ip
+                ref = last.get(src[ip : ip + 4], -1)
+                best = best_ref = 0
+                limit = matchlimit - ip
+                for _ in range(depth):
+                    if ref < 0 or ip - ref > 0xFFFF:
+                        break
+                    if src[ref + best] == src[ip + best]:
+                        length = match_length(ip, ref, limit)
+                        if length > best:
+                            best, best_ref = length, ref
+                            if length >= limit:
+                                break
+                    ref = prev[ref]
+                return best, best_ref
+
+            ip = 0
+            while ip < mflimit:
+                length, ref = find(ip)
+                if not length:
+                    ip += 1
+                    continue
+                if ip + 1 < mflimit:
+                    lazy = find(ip + 1)
+                    if lazy[0] > length + 1:
+                        ip += 1
+                        length, ref = lazy
+                emit(ip, ip - ref, length)
+                anchor = ip = ip + length
+        else:
+            ip = misses = 0
+            while ip < mflimit:
+                key = src[ip : ip + 4]
+                ref = last.get(key)
+                last[key] = ip
+                if ref is None or ip - ref > 0xFFFF:
+                    misses += 1
+                    ip += 1 + (misses >> 6)
+                    continue
+                misses = 0
+                while (
+                    ip > anchor
+                    and ref > 0
+                    and src[ip - 1] == src[ref - 1]
+                ):
+                    ip -= 1
+                    ref -= 1
+                length = match_length(ip, ref, matchlimit - ip)
+                emit(ip, ip - ref, length)
+                anchor = ip = ip + length
+                if ip < mflimit:
+                    last[src[ip - 2 : ip + 2]] = ip - 2
+        if literals := size - anchor:
+            append(min(literals, 15) << 4)
+            if literals >= 15:
+                extend(b"\xff" * ((literals - 15) // 255))
+                append((literals - 15) % 255)
+            extend(src[anchor:])
+        return bytes(res)
+
+    @staticmethod
+    def decompress(block, size):
+        src = memoryview(block)
+        res = bytearray(size)
+        dst = memoryview(res)
+        end = len(src)
+        ip = op = 0
+        while ip < end:
+            token = src[ip]
+            ip += 1
+            if token >= 0x10:
+                length = token >> 4
+                if length == 15:
+                    while True:
+                        last = src[ip]
+                        ip += 1
+                        length += last
+                        if last != 255:
+                            break
+                dst[op : op + length] = src[ip : ip + length]
+                ip += length
+                op += length
+                if ip >= end:
+                    break
+            off = src[ip] | src[ip + 1] << 8
+            ip += 2
+            length = (token & 15) + 4
+            if length == 19:
+                while True:
+                    last = src[ip]
+                    ip += 1
+                    length += last
+                    if last != 255:
+                        break
+            start = op - off
+            if start < 0:
                 raise Exception
-            last = (length := (token[0] & 15) + 4) + 236
-            while last == 255:
-                length += (last := read(1)[0])
-            while length > 0:
-                extend(match := res[off : off + length])
-                off += (match := len(match))
-                length -= match
+            if off >= length:
+                dst[op : op + length] = dst[start : start + length]
+                op += length
+                continue
+            if not off:
+                raise Exception
+            while length > off:
+                dst[op : op + off] = dst[start:op]
+                op += off
+                length -= off
+                off <<= 1
+            dst[op : op + length] = dst[start : start + length]
+            op += length
+        if op != size:
+            raise Exception
+        dst.release()
         return bytes(res)
 
+    @property
+    def data(self):
+        mlen = len(self.MAGIC)
+        with memoryview(self) as view:
+            return self.decompress(view[mlen + 4 :], self.uncomp_len)
+
     @data.setter
     def data(self, value):
-        length = len(value)
-        res = bytearray(pack32(length))
-        if length >= 15:
-            length -= 15
-            res.append(0xF0)
-            res.extend((length // 255) * b"\xff")
-            res.append(length % 255)
-        elif length:
-            res.append(length << 4)
-        self[len(self.MAGIC) :] = bytes(res) + value
+        self[len(self.MAGIC) :] = self.compress(value, self.LEVEL)
+
+    def check_data(self, mlen):
+        end = len(self)
+        ip = mlen + 4
+        op = 0
+        while ip < end:
+            token = self[ip]
+            ip += 1
+            if (length := token >> 4) == 15:
+                while (last := self[ip]) == 255:
+                    length += 255
+                    ip += 1
+                length += last
+                ip += 1
+            ip += length
+            op += length
+            if ip >= end:
+                break
+            off = self[ip] | self[ip + 1] << 8
+            ip += 2
+            if off <= 0 or off > op:
+                return False
+            if (length := (token & 15) + 4) == 19:
+                while (last := self[ip]) == 255:
+                    length += 255
+                    ip += 1
+                length += last
+                ip += 1
+            op += length
+        return ip == end and op == self.uncomp_len
 
     def read_data(self, stream, mlen):
         block = bytearray()
@@ -346,12 +529,281 @@ class LZ4DataChunk(DataChunk):
         self[mlen:] = prefix + block
 
 
+class LZ4DataChunkView:
+    __slots__ = ("view",)
+    MAGIC = LZ4DataChunk.MAGIC
+
+    def __init__(self, view):
+        view = memoryview(view)
+        if len(view) < 8 or view[:4] != self.MAGIC:
+            raise TypeError("Invalid magic")
+        self.view = view
+
+    def __repr__(self):
+        name = type(self).__name__
+        return "%s(data=...%d byte(s)...)" % (name, self.uncomp_len)
+
+    def __len__(self):
+        return len(self.view)
+
+    def __getitem__(self, key):
+        return self.view[key]
+
+    def __bytes__(self):
+        return bytes(self.view)
+
+    def __reduce__(self):
+        return type(self), (bytes(self.view),)
+
+    @property
+    def comp_len(self):
+        return len(self.view)
+
+    @property
+    def uncomp_len(self):
+        return unpack32(self.view[4:8])[0]
+
+    @property
+    def data(self):
+        return LZ4DataChunk.decompress(self.view[8:], self.uncomp_len)
+
+    @property
+    def is_ok(self):
+        try:
+            return LZ4DataChunk.check_data(self, len(self.MAGIC))
+        except Exception:
+            return False
+
+    def release(self):
+        self.view.release()
+
+
 NodeInfo = namedtuple("NodeInfo", "name next child offset size".split())
 
 
+class NodeTable:
+    NONE = (1 << 32) - 1
+
+    def __init__(self, info=()):
+        self.names = []
+        self._name_ids = {}
+        self.name_id = array("I")
+        self.next = array("I")
+        self.child = array("I")
+        self.offset = array("I")
+        self.size = array("I")
+        self._parents = self._children = None
+        self._order = self._ranks = self._shifts = None
+        self.paths = {}
+        for item in info:
+            self.append(item)
+
+    def __repr__(self):
+        return "%s(...%d node info(s)...)" % (
+            type(self).__name__,
+            len(self),
+        )
+
+    def __len__(self):
+        return len(self.name_id)
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(map(self.__getitem__, range(len(self))[index]))
+        n = self.NONE
+        next_id = self.next[index]
+        child = self.child[index]
+        return NodeInfo(
+            self.names[self.name_id[index]],
+            None if next_id == n else next_id,
+            None if child == n else child,
+            self.node_offset(index),
+            self.size[index],
+        )
+
+    def __setitem__(self, index, value):
+        n = self.NONE
+        next_id = n if value.next is None else value.next
+        child = n if value.child is None else value.child
+        name_id = self.intern(value.name)
+        self.flush()
+        self._order = self._ranks = None
+        old = self.name_id[index], self.next[index], self.child[index]
+        if (name_id, next_id, child) != old:
+            self.invalidate()
+        self.name_id[index] = name_id
+        self.next[index] = next_id
+        self.child[index] = child
+        self.offset[index] = value.offset
+        self.size[index] = value.size
+
+    def append(self, value):
+        n = self.NONE
+        self.invalidate()
+        self.flush()
+        self._order = self._ranks = None
+        self.name_id.append(self.intern(value.name))
+        self.next.append(n if value.next is None else value.next)
+        self.child.append(n if value.child is None else value.child)
+        self.offset.append(value.offset)
+        self.size.append(value.size)
+
+    def intern(self, name):
+        res = self._name_ids.get(name)
+        if res is None:
+            res = self._name_ids[name] = len(self.names)
+            self.names.append(bytes(name))
+        return res
+
+    def name(self, index):
+        return self.names[self.name_id[index]]
+
+    def invalidate(self):
+        self._parents = self._children = None
+        self.paths.clear()
+
+    @property
+    def children(self):
+        res = self._children
+        if res is None:
+            n = self.NONE
+            count = len(self)
+            names = self.names
+            name_ids = self.name_id
+            next_ids = self.next
+            heads = [(None, 0)] if count else []
+            heads += (
+                item for item in enumerate(self.child) if item[1] != n
+            )
+            res = {}
+            for parent, child in heads:
+                res[parent] = item = {}
+                for _ in range(count):
+                    name = names[name_ids[child]]
+                    item[name] = item.get(name, ()) + (child,)
+                    child = next_ids[child]
+                    if child == n:
+                        break
+                else:
+                    raise Exception("cyclic node table")
+            self._children = res
+        return res
+
+    def child_ids(self, parent, name):
+        res = self.children.get(parent)
+        return () if res is None else res.get(name, ())
+
+    @property
+    def parents(self):
+        res = self._parents
+        if res is None:
+            n = self.NONE
+            count = len(self)
+            next_ids = self.next
+            parent = array("I", [n]) * count
+            for i, child in enumerate(self.child):
+                while child != n and parent[child] == n:
+                    parent[child] = i
+                    child = next_ids[child]
+            depth = array("I", [n]) * count
+            for i in range(count):
+                path = []
+                while i != n and depth[i] == n:
+                    if len(path) > count:
+                        raise Exception("cyclic node table")
+                    path.append(i)
+                    i = parent[i]
+                d = -1 if i == n else depth[i]
+                for i in reversed(path):
+                    d += 1
+                    depth[i] = d
+            res = self._parents = parent, depth
+        return res
+
+    def parent(self, index):
+        res = self.parents[0][index]
+        return None if res == self.NONE else res
+
+    def depth(self, index):
+        return self.parents[1][index]
+
+    def address(self, index):
+        parent, depth = self.parents
+        res = [0] * (depth[index] + 1)
+        for i in range(depth[index], -1, -1):
+            res[i] = index
+            index = parent[index]
+        return tuple(res)
+
+    def node_path(self, index):
+        return tuple(map(self.name, self.address(index)))
+
+    def node_offset(self, index):
+        res = self.offset[index]
+        if self._shifts is not None:
+            rank = self._ranks[index] + 1
+            shifts = self._shifts
+            while rank:
+                res += shifts[rank]
+                rank &= rank - 1
+        return res
+
+    def resize(self, index, size):
+        delta = size - self.size[index]
+        if not delta:
+            return
+        address = self.address(index)
+        for i in address:
+            self.size[i] += delta
+        if self._order is None:
+            order = sorted(
+                range(len(self)), key=self.offset.__getitem__
+            )
+            self._order = order = array("I", order)
+            self._ranks = ranks = array("I", bytes(4 * len(order)))
+            for rank, i in enumerate(order):
+                ranks[i] = rank
+        if self._shifts is None:
+            self._shifts = [0] * (len(self) + 1)
+        ranks = self._ranks
+        start = ranks[index] + 1
+        self._shift(start, delta)
+        for i in address:
+            rank = ranks[i]
+            if rank >= start:
+                self._shift(rank, -delta)
+                self._shift(rank + 1, delta)
+
+    def flush(self):
+        shifts = self._shifts
+        if shifts is None:
+            return
+        count = len(shifts) - 1
+        for i in range(count, 0, -1):
+            j = i + (i & -i)
+            if j <= count:
+                shifts[j] -= shifts[i]
+        res = 0
+        offset = self.offset
+        for i, delta in zip(self._order, shifts[1:]):
+            res += delta
+            offset[i] += res
+        self._shifts = None
+
+    def _shift(self, rank, delta):
+        shifts = self._shifts
+        rank += 1
+        while rank < len(shifts):
+            shifts[rank] += delta
+            rank += rank & -rank
+
+
 class NodeTableChunk(Chunk):
     EMPTY = b"EDON" + bytes(8)
-    STRUCT_FMT = "<%dsIIII"
+    STRUCT = Struct("<IIII")
 
     def __repr__(self):
         val = type(self).__name__, self.count, self.offset
@@ -388,6 +840,22 @@ class NodeTableChunk(Chunk):
             reslen += 7
         return -res if is_neg else res
 
+    @staticmethod
+    def unpack_int_from(buffer, offset):
+        byte = buffer[offset]
+        offset += 1
+        res = byte & 63
+        if byte & 64:
+            reslen = 6
+            while True:
+                last = buffer[offset]
+                offset += 1
+                res |= (last & 127) << reslen
+                reslen += 7
+                if not last & 128:
+                    break
+        return -res if byte & 128 else res, offset
+
     @property
     def reader(self):
         read = BytesIO(self).read
@@ -400,34 +868,77 @@ class NodeTableChunk(Chunk):
 
     @property
     def info(self):
-        read = self.reader
-        read_packed_int = self.read_packed_int
-        unpack_int = self.unpack_int
-        struct_fmt = self.STRUCT_FMT
-        res = []
-        n = (1 << 32) - 1
-        for _ in range(unpack_int(read_packed_int(read))):
-            s = Struct(struct_fmt % -unpack_int(read_packed_int(read)))
-            s = [None if i == n else i for i in s.unpack(read(s.size))]
-            res.append(NodeInfo(*s))
-        return tuple(res)
+        unpack_int_from = self.unpack_int_from
+        size = self.STRUCT.size
+        res = NodeTable()
+        names = res.names
+        name_ids = res._name_ids
+        name_id = []
+        entries = []
+        with memoryview(self) as view:
+            count, pos = unpack_int_from(view, len(self.MAGIC))
+            for _ in range(count):
+                byte = view[pos]
+                if byte & 64:
+                    namlen, pos = unpack_int_from(view, pos)
+                else:
+                    namlen = -(byte & 63) if byte & 128 else byte
+                    pos += 1
+                end = pos - namlen
+                if end < pos:
+                    raise ValueError
+                name = view[pos:end].tobytes()
+                i = name_ids.get(name)
+                if i is None:
+                    i = name_ids[name] = len(names)
+                    names.append(name)
+                name_id.append(i)
+                pos = end + size
+                entries.append(view[end:pos])
+            entries = b"".join(entries)
+        if len(entries) != count * size:
+            raise ValueError
+        entries = array("I", entries)
+        if byteorder != "little":
+            entries.byteswap()
+        res.name_id.fromlist(name_id)
+        res.next = entries[0::4]
+        res.child = entries[1::4]
+        res.offset = entries[2::4]
+        res.size = entries[3::4]
+        return res
 
     @info.setter
     def info(self, value):
+        if not isinstance(value, NodeTable):
+            value = NodeTable(value)
+        value.flush()
         magiclen = len(self.MAGIC)
-        struct_fmt = self.STRUCT_FMT
         pack_int = self.pack_int
-        res = []
-        n = (1 << 32) - 1
-        for item in value:
-            namlen = len(item.name)
-            struct = Struct(struct_fmt % namlen)
-            item = [n if i is None else i for i in item]
-            res.append(pack_int(-namlen) + struct.pack(*item))
+        names = [pack_int(-len(name)) + name for name in value.names]
+        size = self.STRUCT.size
+        total = size * len(value)
+        entries = array("I", bytes(total))
+        entries[0::4] = value.next
+        entries[1::4] = value.child
+        entries[2::4] = value.offset
+        entries[3::4] = value.size
+        if byteorder != "little":
+            entries.byteswap()
+        entries = entries.tobytes()
+        entries = map(
+            entries.__getitem__,
+            map(
+                slice,
+                range(0, total, size),
+                range(size, total + size, size),
+            ),
+        )
+        res = zip(map(names.__getitem__, value.name_id), entries)
         count = self.read_packed_int(self.reader)
-        if self.unpack_int(count) != len(res):
-            count = pack_int(len(res))
-        self[magiclen:-4] = count + b"".join(res)
+        if self.unpack_int(count) != len(value):
+            count = pack_int(len(value))
+        self[magiclen:-4] = count + b"".join(chain.from_iterable(res))
 
     @property
     def offset(self):
@@ -441,10 +952,10 @@ class NodeTableChunk(Chunk):
         read = self.reader
         read_packed_int = self.read_packed_int
         unpack_int = self.unpack_int
-        struct_fmt = self.STRUCT_FMT
+        size = self.STRUCT.size
         for _ in range(unpack_int(read_packed_int(read))):
-            s = Struct(struct_fmt % -unpack_int(read_packed_int(read)))
-            if len(read(s.size)) != s.size:
+            n = size - unpack_int(read_packed_int(read))
+            if len(read(n)) != n:
                 return False
         return len(read(5)) == 4
 
@@ -452,13 +963,13 @@ class NodeTableChunk(Chunk):
         read = stream.read
         read_packed_int = self.read_packed_int
         unpack_int = self.unpack_int
-        struct_fmt = self.STRUCT_FMT
+        size = self.STRUCT.size
         data = [read_packed_int(read)]
         for _ in range(unpack_int(data[-1])):
             data.append(read_packed_int(read))
-            s = Struct(struct_fmt % -unpack_int(data[-1]))
-            data.append(read(s.size))
-            if len(data[-1]) != s.size:
+            n = size - unpack_int(data[-1])
+            data.append(read(n))
+            if len(data[-1]) != n:
                 raise Exception
         data.append(read(4))
         if len(data[-1]) != 4:
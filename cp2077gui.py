@@ -17,7 +17,9 @@ OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 from os import environ
 from pathlib import Path
+from queue import Empty, Queue
 from sys import argv
+from threading import Event, Thread
 from tkinter import N, W, S, E, Listbox, StringVar, Tk
 from tkinter.ttk import Button, Entry, Frame, Label
 from cp2077save import SaveFile
@@ -38,28 +40,40 @@ if not HOME.is_dir():
 
 
 def get_savefiles():
-    res = []
-    for item in HOME.iterdir():
-        try:
-            item = SaveFile.summary(item)
-        except Exception:
-            pass
-        else:
-            res.append((item.date, item.time, item))
+    res = SaveFile.scan(HOME)
+    res = [(item.date, item.time, item) for item in res]
     return [item[-1] for item in sorted(res, reverse=True)]
 
 
-if (HOME / SaveFile.NAME).is_file() and not get_savefiles():
+SAVEFILES = get_savefiles()
+if (HOME / SaveFile.NAME).is_file() and not SAVEFILES:
     HOME = HOME.parent
+    SAVEFILES = get_savefiles()
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Task:
+    def __init__(self):
+        self.cancelled = Event()
+        self.queue = Queue()
+
+    def progress(self, text):
+        if self.cancelled.is_set():
+            raise Cancelled
+        self.queue.put(("progress", text))
 
 
 class Window:
     TITLE = ""
     WIDTH = 600
     HEIGHT = 400
+    POLL_INTERVAL = 50
 
     def __init__(self):
-        self.savefiles = tuple(get_savefiles())
+        self.savefiles = tuple(SAVEFILES)
         self.root = root = Tk()
         root.title(self.TITLE)
         root.minsize(self.WIDTH // 2, self.HEIGHT // 2)
@@ -70,6 +84,7 @@ class Window:
         frm.grid(row=0, column=0, sticky=(N, W, S, E))
         self._vars = {}
         self._savefile = None
+        self._task = None
         self.init(frm)
         root.mainloop()
 
@@ -88,6 +103,61 @@ class Window:
             self._savefile = res
         return res
 
+    def start_task(self, func, done, failed=None, cancelled=None):
+        if self._task is not None:
+            raise Exception("another task is running")
+        task = self._task = Task()
+        self.set_selectbox_state("disabled")
+        Thread(
+            target=self._run_task, args=(task, func), daemon=True
+        ).start()
+        handlers = {
+            "done": done,
+            "failed": failed,
+            "cancelled": cancelled,
+        }
+        self.root.after(
+            self.POLL_INTERVAL, self._poll_task, task, handlers
+        )
+        return task
+
+    def cancel_task(self):
+        if self._task is not None:
+            self._task.cancelled.set()
+
+    def task_progress(self, text):
+        pass
+
+    def _run_task(self, task, func):
+        try:
+            res = "done", func(task)
+        except Cancelled:
+            res = "cancelled", None
+        except Exception as e:
+            res = "failed", e
+        task.queue.put(res)
+
+    def _poll_task(self, task, handlers):
+        while True:
+            try:
+                kind, value = task.queue.get_nowait()
+            except Empty:
+                break
+            if kind == "progress":
+                self.task_progress(value)
+                continue
+            self._task = None
+            self.set_selectbox_state("normal")
+            handler = handlers[kind]
+            if handler is not None:
+                handler(value)
+            if kind == "failed":
+                raise value
+            return
+        self.root.after(
+            self.POLL_INTERVAL, self._poll_task, task, handlers
+        )
+
     def vars(self, name, *args):
         all_vars = self._vars
         if name not in all_vars:
@@ -112,6 +182,11 @@ class Window:
             lbox.itemconfigure(i, background="#f0f0ff")
         return lbox
 
+    def set_selectbox_state(self, state):
+        lbox = getattr(self, "_savefile_selectbox", None)
+        if lbox is not None:
+            lbox.configure(state=state)
+
     def select_savefile(self, ind):
         savefiles = self.savefiles
         n = len(savefiles)
@@ -188,13 +263,20 @@ class DatamineVirtuosoFixer(Window):
         self.btn_fix = Button(
             right, text="Fix File", command=self.fix_file
         )
+        self.btn_cancel = Button(
+            right, text="Cancel", command=self.cancel_task
+        )
         self.btn_load.grid(row=1, column=0)
         self.btn_fix.grid(row=1, column=1)
+        self.btn_cancel.grid(row=2, column=0, columnspan=2)
+        self.btn_cancel.state(["disabled"])
         self.select_savefile(0)
         self.selection_changed()
         lbox.bind("<<ListboxSelect>>", self.selection_changed)
 
     def selection_changed(self, *args):
+        if self._task is not None:
+            return
         enable = "!disabled"
         summary = self.selected_savefile()
         if summary is None:
@@ -204,17 +286,39 @@ class DatamineVirtuosoFixer(Window):
         self.update_savefile_summary(summary)
         self.vars("f_shard_drops", "load to find")
 
+    def task_progress(self, text):
+        self.vars("f_shard_drops", text + "...")
+
     def load_file(self):
+        summary = self.selected_savefile()
+        if summary is None:
+            return
         self.btn_load.state(["disabled"])
+        self.btn_fix.state(["disabled"])
+        self.btn_cancel.state(["!disabled"])
         self._savefile = None
-        if self.savefile is None:
-            self.btn_load.state(["!disabled"])
-            self.vars("f_shard_drops", "failed to load :-(")
-        else:
+
+        def work(task):
+            def reading(i, count):
+                task.progress("reading file %d/%d" % (i + 1, count))
+
+            def parsing(i, count):
+                task.progress("parsing node %d/%d" % (i + 1, count))
+
+            task.progress("reading file")
+            savefile = SaveFile(summary.path, progress=reading)
+            task.progress("parsing node")
+            savefile.progress = parsing
+            node = savefile.nodes.ScriptableSystemsContainer
+            config = node.__enter__()
+            savefile.progress = None
+            task.progress("reading field")
+            return savefile, node, config
+
+        def done(value):
+            self.btn_cancel.state(["disabled"])
+            self._savefile, self.node, self.config = value
             try:
-                nodes = self.savefile.nodes
-                self.node = nodes.ScriptableSystemsContainer
-                self.config = self.node.__enter__()
                 res = self.config.DataTrackingSystem.failedShardDrops
             except Exception:
                 self.vars("f_shard_drops", "failed to locate data :-(")
@@ -225,20 +329,53 @@ class DatamineVirtuosoFixer(Window):
             else:
                 self.vars("f_shard_drops", "0 ; no need to fix")
 
+        def failed(error):
+            self.btn_cancel.state(["disabled"])
+            self.btn_load.state(["!disabled"])
+            self.vars("f_shard_drops", "failed to load :-(")
+
+        def cancelled(value):
+            self.btn_cancel.state(["disabled"])
+            self.btn_load.state(["!disabled"])
+            self.vars("f_shard_drops", "load to find")
+
+        self.start_task(work, done, failed, cancelled)
+
     def fix_file(self):
         self.btn_load.state(["disabled"])
         self.btn_fix.state(["disabled"])
-        try:
-            self.config.DataTrackingSystem.failedShardDrops = 0
-            self.node.__exit__(None, None, None)
-        except Exception:
-            self.vars("f_shard_drops", "failed to change field :-(")
-            del self.config, self.node
-            raise
+        self.btn_cancel.state(["!disabled"])
+        savefile, node, config = self._savefile, self.node, self.config
         del self.config, self.node
-        try:
-            self.savefile.save()
-        except Exception:
-            self.vars("f_shard_drops", "could not save file :-(")
-            raise
-        self.vars("f_shard_drops", "0 ; file has been changed :-)")
+
+        def work(task):
+            task.progress("changing field")
+            try:
+                config.DataTrackingSystem.failedShardDrops = 0
+                node.__exit__(None, None, None)
+            except Exception:
+                raise Exception("failed to change field :-(")
+            task.progress("saving file")
+            try:
+                savefile.save()
+            except Exception:
+                raise Exception("could not save file :-(")
+
+        def done(value):
+            self.btn_cancel.state(["disabled"])
+            self.btn_load.state(["!disabled"])
+            self.vars("f_shard_drops", "0 ; file has been changed :-)")
+
+        def failed(error):
+            self._savefile = None
+            self.btn_cancel.state(["disabled"])
+            self.btn_load.state(["!disabled"])
+            self.vars("f_shard_drops", str(error))
+
+        def cancelled(value):
+            self._savefile = None
+            self.btn_cancel.state(["disabled"])
+            self.btn_load.state(["!disabled"])
+            self.vars("f_shard_drops", "load to find")
+
+        self.start_task(work, done, failed, cancelled)
@@ -17,33 +17,213 @@ OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 from collections import namedtuple
 from itertools import chain, repeat
-from struct import Struct
-from cp2077type import Type
+from operator import gt, is_not, sub
+from struct import Struct, iter_unpack, pack_into, unpack_from
+from cp2077type import Array, Bool, Scalar, Type
 
 pack16 = Struct("<H").pack
 unpack16 = Struct("<H").unpack
+unpack32 = Struct("<I").unpack
+
+
+class StringTable:
+    __slots__ = "_data", "_start", "_cache", "layouts"
+
+    def __init__(self, data, start, stop):
+        self._data = data
+        self._start = start
+        self._cache = [None] * ((stop - start) // 4)
+        self.layouts = {}
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    def __getitem__(self, index):
+        res = self._cache[index]
+        if res is None:
+            data = self._data
+            start = self._start + 4 * index
+            p = unpack32(data[start : start + 4])[0]
+            n = p >> 24
+            p &= (1 << 24) - 1
+            if n < 1 or p + n > len(data) or data[p + n - 1]:
+                raise Exception
+            res = bytes(data[p : p + n - 1])
+            if 0 in res:
+                raise Exception
+            try:
+                if res.decode().encode() == res:
+                    res = res.decode()
+            except Exception:
+                pass
+            self._cache[index] = res
+        return res
+
+    def validate(self, end):
+        data = self._data
+        p = self._start + 4 * len(self)
+        for i in range(len(self)):
+            ind = unpack32(data[self._start + 4 * i :][:4])[0]
+            if (ind & ((1 << 24) - 1)) != p:
+                raise Exception
+            self[i]
+            p += ind >> 24
+        if p != end or len(set(self)) != len(self):
+            raise Exception
+
+
+class Layout:
+    CACHE = {}
+
+    def __init__(self, key):
+        n = len(key)
+        self.names = []
+        self.keep = []
+        for i, (name, _) in enumerate(key):
+            if name not in self.names:
+                self.names.append(name)
+                self.keep.append(i)
+        self.types = [item[1] for item in key]
+        self.offsets = Struct("<" + "4xI" * n)
+        self.runs = []
+        self.bools = []
+        self.others = []
+        i = 0
+        while i < n:
+            if not isinstance(self.types[i], Scalar):
+                self.others.append(i)
+                i += 1
+                continue
+            fmt = "<"
+            rel = [0]
+            start = i
+            while i < n and isinstance(self.types[i], Scalar):
+                t = self.types[i]
+                if isinstance(t, Bool):
+                    self.bools.append(i)
+                fmt += t.fmt
+                rel.append(rel[-1] + t.size)
+                i += 1
+            self.runs.append((start, i, Struct(fmt), tuple(rel)))
+
+    @classmethod
+    def get(cls, key):
+        res = cls.CACHE.get(key)
+        if res is None:
+            res = cls.CACHE[key] = cls(key)
+        return res
+
+    def decode(self, data):
+        offsets = self.offsets.unpack_from(data, 2) + (len(data),)
+        types = self.types
+        values = [None] * len(types)
+        others = self.others
+        for start, stop, struct, rel in self.runs:
+            base = offsets[start]
+            delta = tuple(
+                map(sub, offsets[start : stop + 1], repeat(base))
+            )
+            if delta == rel:
+                values[start:stop] = struct.unpack_from(data, base)
+            else:
+                others = others + list(range(start, stop))
+        for i in self.bools:
+            if i not in others:
+                if values[i] > 1:
+                    raise ValueError(
+                        "bad boolean value: %d" % values[i]
+                    )
+                values[i] = bool(values[i])
+        for i in others:
+            value = bytes(data[offsets[i] : offsets[i + 1]])
+            values[i] = types[i].from_bytes(value)
+        return dict(zip(self.names, map(values.__getitem__, self.keep)))
+
+
+class ArrayView:
+    __slots__ = "_data", "_index", "_item"
+
+    def __init__(self, data, index, item):
+        self._data = data
+        self._index = index
+        self._item = item
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, tuple(self))
+
+    def __len__(self):
+        start = self._data._field_info(self._index)[2].start
+        return unpack32(self._data._get(slice(start, start + 4)))[0]
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return tuple(map(self.__getitem__, range(len(self))[key]))
+        start = self._offset(key)
+        end = start + self._item.size
+        return self._item.from_bytes(
+            bytes(self._data._get(slice(start, end)))
+        )
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            key = range(len(self))[key]
+            value = tuple(value)
+            if len(key) != len(value):
+                raise ValueError("cannot resize array view")
+            for key, value in zip(key, value):
+                self[key] = value
+            return
+        value = self._item.to_bytes(value)
+        start = self._offset(key)
+        data = self._data
+        data._touch()
+        bytearray.__setitem__(
+            data, slice(start, start + len(value)), value
+        )
+
+    def _offset(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if index < 0 or index >= count:
+            raise IndexError
+        start = self._data._field_info(self._index)[2].start
+        return start + 4 + index * self._item.size
 
 
 class StructData(bytearray):
-    __slots__ = "_name", "_strings"
+    __slots__ = "_name", "_strings", "_clean", "_fields"
 
     def __init__(self, strings, name, data):
-        self._name = strings[name]
-        self._strings = strings
+        setattr = bytearray.__setattr__
+        setattr(self, "_name", strings[name])
+        setattr(self, "_strings", strings)
+        setattr(self, "_fields", None)
+        setattr(self, "_clean", isinstance(data, memoryview))
         bytearray.__init__(self, data)
 
     def __len__(self):
-        return unpack16(super().__getitem__(slice(0, 2)))[0]
+        return unpack16(self._get(slice(0, 2)))[0]
+
+    def __bytes__(self):
+        return bytes(memoryview(self))
 
     def __getitem__(self, key):
         name, t, slc = self._field_info(key)
-        return t.from_bytes(bytes(super().__getitem__(slc)))
+        return t.from_bytes(bytes(self._get(slc)))
 
     def __setitem__(self, key, value):
         if isinstance(key, (bytes, str)):
             key = self._field_index(key)
         name, t, slc = self._field_info(key)
         value = t.to_bytes(value)
+        self._touch()
         sup = super()
         setitem = sup.__setitem__
         setitem(slc, value)
@@ -57,17 +237,14 @@ class StructData(bytearray):
                 slc = 6 + 8 * i
                 slc = slice(slc, slc + 4)
                 setitem(slc, pack(unpack(get(slc))[0] + change))
+            self._fields = None
 
     def __repr__(self):
         return "%s(...%d fields...)" % (self._name, len(self))
 
     def __dir__(self):
         res = []
-        strings = self._strings
-        get = super().__getitem__
-        for i in range(len(self)):
-            start = 2 + 8 * i
-            name = strings[unpack16(get(slice(start, start + 2)))[0]]
+        for name, _, _ in self._field_table()[0]:
             if isinstance(name, str) and name.isidentifier():
                 res.append(name)
         return res
@@ -86,52 +263,136 @@ class StructData(bytearray):
         except LookupError:
             raise AttributeError(name)
 
+    def view(self, key):
+        if isinstance(key, (bytes, str)):
+            key = self._field_index(key)
+        name, t, slc = self._field_info(key)
+        if not isinstance(t, Array) or not isinstance(t.item, Scalar):
+            raise TypeError(
+                "%s is not an array of fixed size items" % t
+            )
+        return ArrayView(self, key, t.item)
+
+    def to_dict(self):
+        with memoryview(self) as data:
+            n = 2 + 8 * unpack16(data[:2])[0]
+            layouts = self._strings.layouts
+            key = data[2:n].cast("I")[::2].tobytes()
+            res = layouts.get(key)
+            if res is None:
+                strings = self._strings
+                cached = Type.cached
+                res = Layout.get(
+                    tuple(
+                        (strings[name], cached(strings[t]))
+                        for name, t, _ in iter_unpack("<HHI", data[2:n])
+                    )
+                )
+                layouts[key] = res
+            return res.decode(data)
+
+    def update(self, *args, **kwargs):
+        values = {}
+        for key, value in chain(dict(*args).items(), kwargs.items()):
+            if isinstance(key, (bytes, str)):
+                key = self._field_index(key)
+            name, t, slc = self._field_info(key)
+            values[key] = t.to_bytes(value)
+        if not values:
+            return
+        get = self._get
+        fields = self._field_table()[0]
+        pos = 2 + 8 * len(fields)
+        head = bytearray(get(slice(0, pos)))
+        data = [get(slice(pos, fields[0][2].start))]
+        pos += len(data[0])
+        for i, (name, t, slc) in enumerate(fields):
+            value = values.get(i)
+            if value is None:
+                value = get(slc)
+            pack_into("<I", head, 6 + 8 * i, pos)
+            data.append(value)
+            pos += len(value)
+        data = b"".join(data)
+        self._clean = False
+        bytearray.__init__(self, head + data)
+        self._fields = None
+
+    def _get(self, key):
+        return bytearray.__getitem__(self, key)
+
+    def _touch(self):
+        self._clean = False
+
+    def _field_table(self):
+        res = self._fields
+        if res is None:
+            strings = self._strings
+            cached = Type.cached
+            n = 2 + 8 * len(self)
+            fields = list(iter_unpack("<HHI", self._get(slice(2, n))))
+            ends = [item[2] for item in fields[1:]] + [None]
+            fields = [
+                (strings[name], cached(strings[t]), slice(off, end))
+                for (name, t, off), end in zip(fields, ends)
+            ]
+            index = {}
+            for i, item in enumerate(fields):
+                index.setdefault(item[0], i)
+            res = self._fields = fields, index
+        return res
+
     def _field_index(self, name):
         if isinstance(name, bytes):
             try:
                 name = name.decode()
             except Exception:
                 pass
-        strings = self._strings
-        get = super().__getitem__
-        for i in range(len(self)):
-            start = 2 + 8 * i
-            name_id = unpack16(get(slice(start, start + 2)))[0]
-            if name == strings[name_id]:
-                return i
-        raise KeyError
+        return self._field_table()[1][name]
 
     def _field_name(self, index):
-        if not isinstance(index, int):
-            raise TypeError
-        get = super().__getitem__
-        if index < 0 or index >= len(self):
-            raise IndexError
-        index *= 8
-        name = unpack16(get(slice(index + 2, index + 4)))[0]
-        return self._strings[name]
+        return self._field_info(index)[0]
 
     def _field_info(self, index):
         if isinstance(index, (bytes, str)):
             index = self._field_index(index)
         if not isinstance(index, int):
             raise TypeError
-        get = super().__getitem__
-        n = len(self)
-        if index < 0 or index >= n:
+        fields = self._field_table()[0]
+        if index < 0 or index >= len(fields):
             raise IndexError
-        unpack = Struct("<HHI").unpack
-        start = 2 + 8 * index
-        name, t, off = unpack(get(slice(start, start + 8)))
-        end = None
-        if index < n - 1:
-            end = unpack(get(slice(start + 8, start + 16)))[2]
-        strings = self._strings
-        return strings[name], Type(strings[t]), slice(off, end)
+        return fields[index]
+
+
+def _mutating_method(name):
+    method = getattr(bytearray, name)
+
+    def wrapper(self, *args):
+        self._touch()
+        return method(self, *args)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in (
+    "__delitem__",
+    "__iadd__",
+    "__imul__",
+    "append",
+    "clear",
+    "extend",
+    "insert",
+    "pop",
+    "remove",
+    "reverse",
+):
+    setattr(StructData, _name, _mutating_method(_name))
+del _name
 
 
 class StructListNode(list):
-    def __init__(self, data):
+    def __init__(self, data, lazy=False):
         unpack1 = Struct("<I").unpack
         unpack2 = Struct("<II").unpack
         if len(data) < 32 or unpack2(data[:8])[1] != len(data) - 8:
@@ -146,51 +407,54 @@ class StructListNode(list):
         if unpack2(self._unknown1)[1] >= 2:
             base += 4 + 8 * unpack1(data[base : base + 4])[0]
         self._unknown2 = bytes(data[32:base])
-        data = bytes(data[base:])
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        raw = memoryview(data)
+        data = raw[base:]
         p = 0
         if string_ind[0] != p or (string_ind[1] - p) % 4:
             raise Exception
-        self._strings = []
-        p = string_ind[1]
-        for i in range(string_ind[0], p, 4):
-            ind = unpack1(data[i : i + 4])[0]
-            if (ind & ((1 << 24) - 1)) != p:
+        self._strings = StringTable(data, *string_ind)
+        p = data_ind[0]
+        if lazy:
+            ind = unpack1(data[string_ind[0] : string_ind[0] + 4])[0]
+            if ind & ((1 << 24) - 1) != string_ind[1]:
                 raise Exception
-            ind >>= 24
-            if ind < 1 or data[p + ind - 1]:
+            ind = unpack1(data[string_ind[1] - 4 : string_ind[1]])[0]
+            if (ind & ((1 << 24) - 1)) + (ind >> 24) != p:
                 raise Exception
-            string = bytes(data[p : p + ind - 1])
-            if 0 in string:
-                raise Exception
-            try:
-                if string.decode().encode() == string:
-                    string = string.decode()
-            except Exception:
-                pass
-            self._strings.append(string)
-            p += ind
-        if len(set(self._strings)) != len(self._strings):
-            raise Exception
-        if data_ind[0] != p or (data_ind[1] - p) % 8:
+        else:
+            self._strings.validate(p)
+        if (data_ind[1] - p) % 8:
             raise Exception
         p = data_ind[1]
-        value = [
-            unpack2(data[i : i + 8]) for i in range(data_ind[0], p, 8)
-        ]
-        if value:
-            if value[0][1] != p:
-                raise Exception
-        else:
-            if len(data) != p:
-                raise Exception
-        for i, (ind, p) in enumerate(value):
-            end = None
-            if i + 1 < len(value):
-                end = value[i + 1][1]
-                if end < p:
-                    raise Exception
-            value[i] = StructData(self._strings, ind, data[p:end])
-        super().__init__(value)
+        names, offsets = zip(*iter_unpack("<II", data[data_ind[0] : p]))
+        if offsets[0] != p or any(map(gt, offsets, offsets[1:])):
+            raise Exception
+        offsets += (len(data),)
+        super().__init__(
+            map(
+                StructData,
+                repeat(self._strings),
+                names,
+                map(data.__getitem__, map(slice, offsets, offsets[1:])),
+            )
+        )
+        self._source = raw, base, data_ind[0], offsets, tuple(self)
+        self._source += (self._strings,)
+
+    @staticmethod
+    def sniff(data):
+        if len(data) < 32:
+            return False
+        size, s0, s1, d0, d1 = unpack_from("<I8x4I", data, 4)
+        return (
+            size == len(data) - 8
+            and s0 == 0
+            and s0 < s1 <= d0 < d1 <= len(data)
+            and s1 % 4 == 0
+            and (d1 - d0) % 8 == 0
+        )
 
     def __dir__(self):
         res = {}
@@ -210,6 +474,46 @@ class StructListNode(list):
         return res[0]
 
     def __bytes__(self):
+        raw, base, index, offsets, items, strings = self._source
+        if (
+            self._strings is not strings
+            or len(self) != len(items)
+            or any(map(is_not, self, items))
+        ):
+            return self._rebuild()
+        dirty = [i for i, item in enumerate(items) if not item._clean]
+        if not dirty:
+            return raw.obj
+        size = len(raw)
+        for i in dirty:
+            size += bytearray.__len__(items[i]) - offsets[i + 1]
+            size += offsets[i]
+        res = bytearray(size)
+        src = dst = base + offsets[dirty[0]]
+        res[:dst] = raw[:dst]
+        pack_into("<I", res, 4, size - 8)
+        shift = 0
+        for i in dirty:
+            n = base + offsets[i] - src
+            res[dst : dst + n] = raw[src : src + n]
+            dst += n
+            item = items[i]
+            n = bytearray.__len__(item)
+            res[dst : dst + n] = item
+            dst += n
+            src = base + offsets[i + 1]
+        res[dst:] = raw[src:]
+        index += base + 4
+        dirty = set(dirty)
+        for i in range(min(dirty) + 1, len(items)):
+            if i - 1 in dirty:
+                shift += bytearray.__len__(items[i - 1])
+                shift -= offsets[i] - offsets[i - 1]
+            if shift:
+                pack_into("<I", res, index + 8 * i, offsets[i] + shift)
+        return bytes(res)
+
+    def _rebuild(self):
         pack1 = Struct("<I").pack
         pack2 = Struct("<II").pack
         data = bytearray(4 * len(self._strings))
@@ -242,9 +546,36 @@ class StructListNode(list):
         return pack2(self._node_id, len(h) + len(data)) + h + data
 
 
-def parse_node(data, path):
-    try:
-        return StructListNode(data)
-    except Exception:
-        pass
+PARSERS = {}
+
+
+def parse_raw(data, path):
     return bytearray(data)
+
+
+def parse_struct_list(data, path):
+    return StructListNode(data, lazy=True)
+
+
+def register_parser(key, parser):
+    if isinstance(key, str):
+        key = key.encode()
+    elif not isinstance(key, bytes):
+        key = tuple(
+            i.encode() if isinstance(i, str) else i for i in key
+        )
+    PARSERS[key] = parser
+
+
+def parse_node(data, path):
+    path = tuple(path)
+    name = path[-1] if path else None
+    parser = PARSERS.get(path) or PARSERS.get(name)
+    if parser is not None:
+        return parser(data, path)
+    if StructListNode.sniff(data):
+        try:
+            return parse_struct_list(data, path)
+        except Exception:
+            pass
+    return parse_raw(data, path)
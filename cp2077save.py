@@ -15,17 +15,136 @@ ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
 OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 """
 
+from argparse import ArgumentParser
+from ast import literal_eval
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fnmatch import fnmatch
+from io import BytesIO
+from itertools import chain
+from mmap import ACCESS_READ, mmap as MemoryMap
+from json import dump, dumps, load
+from math import isfinite
+from operator import attrgetter
+from os import environ, replace, scandir, stat
+from os.path import join
 from pathlib import Path
+from sys import stdout
+from time import perf_counter
 from typing import NamedTuple
+from cp2077backup import BackupStore
 from cp2077chunk import (
     ChunkInfo,
     DataChunk,
     DataChunkTableChunk,
     EndChunk,
     HeaderChunk,
+    LZ4DataChunkView,
+    NodeTable,
     NodeTableChunk,
 )
-from cp2077node import parse_node
+from cp2077node import StructListNode, parse_node
+
+
+class ChunkCache:
+    def __init__(self, save, budget=None):
+        self._save = save
+        self._items = OrderedDict()
+        self._dirty = set()
+        self.budget = budget
+        self.size = 0
+
+    def get(self, indices, workers=None):
+        chunks = self._save.data_chunks
+        items = self._items
+        res = {}
+        missing = []
+        for i in indices:
+            item = items.get(i)
+            if item is not None and item[0] is chunks[i]:
+                items.move_to_end(i)
+                res[i] = item[1]
+            else:
+                missing.append(i)
+        if missing:
+            data = [chunks[i] for i in missing]
+            data = self._save._decompress(data, workers)
+            for i, value in zip(missing, data):
+                self._store(i, chunks[i], value)
+                res[i] = value
+            self._evict()
+        return [res[i] for i in indices]
+
+    def write(self, index, start, value):
+        org = self.get([index])[0]
+        end = start + len(value)
+        if start > len(org):
+            raise IndexError
+        if org[start:end] == value:
+            return False
+        new = org if isinstance(org, bytearray) else bytearray(org)
+        new[start:end] = value
+        item = self._items.get(index)
+        if item is None:
+            self._set_data(index, new)
+        else:
+            self._items[index] = item[0], new
+            self._dirty.add(index)
+        return True
+
+    def replace(self, index, value):
+        chunk = self._set_data(index, value)
+        self._store(index, chunk, value)
+        self._evict()
+
+    def rebind(self, index, old, new):
+        item = self._items.get(index)
+        if item is not None and item[0] is old:
+            self._items[index] = new, item[1]
+
+    def drop(self, index):
+        item = self._items.pop(index, None)
+        if item is not None:
+            self.size -= len(item[1])
+        self._dirty.discard(index)
+
+    def flush(self):
+        chunks = self._save.data_chunks
+        items = self._items
+        for i in sorted(self._dirty):
+            chunk, value = items[i]
+            if i < len(chunks) and chunk is chunks[i]:
+                items[i] = self._set_data(i, value), value
+        self._dirty.clear()
+
+    def _set_data(self, index, value):
+        chunks = self._save.data_chunks
+        chunk = chunks[index]
+        if isinstance(chunk, DataChunk):
+            chunk.data = value
+        else:
+            chunks[index] = chunk = DataChunk(data=value)
+        return chunk
+
+    def _store(self, index, chunk, value):
+        self.drop(index)
+        self._items[index] = chunk, value
+        self.size += len(value)
+
+    def _evict(self):
+        budget = self.budget
+        if budget is None:
+            return
+        chunks = self._save.data_chunks
+        items = self._items
+        while self.size > budget and items:
+            i, (chunk, value) = items.popitem(last=False)
+            self.size -= len(value)
+            if i in self._dirty:
+                self._dirty.discard(i)
+                if i < len(chunks) and chunk is chunks[i]:
+                    self._set_data(i, value)
 
 
 class Data:
@@ -35,7 +154,7 @@ class Data:
     def __len__(self):
         save = self._save
         offset = len(save.header) + len(save._data_chunks)
-        return offset + sum(x.uncomp_len for x in save.data_chunks)
+        return offset + save._chunk_offsets()[-1]
 
     def __getitem__(self, key):
         if isinstance(key, int):
@@ -45,24 +164,17 @@ class Data:
         save = self._save
         header = save.header
         info = save._data_chunks
-        data = save.data_chunks
-        size = len(header) + len(info) + sum(x.uncomp_len for x in data)
-        start, size = key.indices(size)[:2]
-        size -= start
+        start, stop = key.indices(len(self))[:2]
         res = []
-        if size > 0 and start < len(header):
-            res.append(header[start : start + size])
-            size -= len(res[-1])
-        start -= min(start, len(header))
-        if size > 0 and start < len(info):
-            res.append(info[start : start + size])
-            size -= len(res[-1])
-        start -= min(start, len(info))
-        for chunk in data:
-            if size > 0 and start < chunk.uncomp_len:
-                res.append(chunk.data[start : start + size])
-                size -= len(res[-1])
-            start -= min(start, chunk.uncomp_len)
+        if start < len(header):
+            res.append(header[start:stop])
+        n = len(header)
+        if start < n + len(info) and stop > n:
+            res.append(info[max(start - n, 0) : stop - n])
+        parts = self._locate(start, stop)
+        chunks = save._cache.get([item[0] for item in parts])
+        for (_, start, end), chunk in zip(parts, chunks):
+            res.append(chunk[start:end])
         return b"".join(res)
 
     def __setitem__(self, key, value):
@@ -74,14 +186,16 @@ class Data:
         if not isinstance(value, (bytes, bytearray)):
             raise TypeError("expected bytes or bytearray")
         save = self._save
+        cache = save._cache
         header = save.header
         info = save._data_chunks
         data = save.data_chunks
-        size = len(header) + len(info) + sum(x.uncomp_len for x in data)
-        start, size = key.indices(size)[:2]
-        size -= start
+        offsets = save._chunk_offsets()
+        start, stop = key.indices(len(self))[:2]
+        size = max(stop - start, 0)
         chunk_size = data[0].uncomp_len
         if size != len(value):
+            save._field_index = None
             value = bytes(value) + self[start + size :]
             n = start + len(value)
             if n < len(header) + len(info) + chunk_size:
@@ -93,49 +207,57 @@ class Data:
             if value:
                 n = chunk_size - data[-1].uncomp_len
                 if n > 0:
-                    data[-1].data += value[:n]
+                    i = len(data) - 1
+                    cache.replace(i, cache.get([i])[0] + value[:n])
+                    offsets[-1] = offsets[-2] + data[-1].uncomp_len
                     value = value[n:]
                 while value:
                     data.append(DataChunk(data=value[:chunk_size]))
+                    offsets.append(offsets[-1] + data[-1].uncomp_len)
                     value = value[chunk_size:]
             else:
                 start -= len(header) + len(info)
-                n = (start + chunk_size - 1) // chunk_size
+                n = bisect_left(offsets, start)
                 while len(data) > n:
                     data.pop()
-                start %= chunk_size
+                    offsets.pop()
+                    cache.drop(len(data))
+                start -= offsets[-2]
                 if data[-1].uncomp_len > start:
-                    data[-1].data = data[-1].data[:start]
+                    i = len(data) - 1
+                    cache.replace(i, cache.get([i])[0][:start])
+                    offsets[-1] = offsets[-2] + start
             return
-        n = len(value)
         if size > 0 and start < len(header):
             n = min(len(header) - start, size)
             header[start : start + n] = value[:n]
-            value = value[n:]
-            size -= n
-        start -= min(start, len(header))
-        if size > 0 and start < len(info):
-            n = min(len(info) - start, size)
-            info[start : start + n] = value[:n]
-            value = value[n:]
-            size -= n
-        start -= min(start, len(info))
-        for chunk in data:
-            if size > 0 and start < chunk_size:
-                org = chunk.data
-                if start > len(org):
-                    raise IndexError
-                new = bytearray(org)
-                n = min(chunk_size - start, size)
-                new[start : start + n] = value[:n]
-                value = value[n:]
-                size -= n
-                if new != org:
-                    chunk.data = new
-                del org, new
-            start -= min(start, chunk.uncomp_len)
-        if start > 0:
-            raise IndexError
+        n = len(header)
+        if size > 0 and start < n + len(info) and stop > n:
+            i = max(start - n, 0)
+            j = min(stop - n, len(info))
+            info[i:j] = value[i + n - start : j + n - start]
+        n = max(save.nodes_data_offset - start, 0)
+        for i, start, end in self._locate(start, stop):
+            if cache.write(i, start, value[n : n + end - start]):
+                save._field_index = None
+            n += end - start
+
+    def _locate(self, start, stop):
+        save = self._save
+        offsets = save._chunk_offsets()
+        base = save.nodes_data_offset
+        start = max(start - base, 0)
+        stop -= base
+        res = []
+        i = bisect_right(offsets, start) - 1
+        n = len(offsets) - 1
+        while start < stop and i < n:
+            end = min(offsets[i + 1], stop)
+            if end > start:
+                res.append((i, start - offsets[i], end - offsets[i]))
+                start = end
+            i += 1
+        return res
 
 
 class NodeDirectory:
@@ -145,39 +267,37 @@ class NodeDirectory:
         self._ctx = []
 
     def __dir__(self):
-        res = {}
-        for _, item in self._items():
-            name = item.name
+        res = []
+        children = self._save.nodes_info.children.get(self._node_id, {})
+        for name, ids in children.items():
             try:
                 name = name.decode()
-                if name.isidentifier():
-                    res[name] = name not in res
+                if name.isidentifier() and len(ids) == 1:
+                    res.append(name)
             except Exception:
                 pass
-        return [item[0] for item in res.items() if item[1]]
+        return res
 
     def __iter__(self):
         nodes_info = self._save.nodes_info
+        next_ids = nodes_info.next
+        none = nodes_info.NONE
         next_id = self._node_id
-        next_id = 0 if next_id is None else nodes_info[next_id].child
-        while next_id is not None:
+        next_id = 0 if next_id is None else nodes_info.child[next_id]
+        while next_id != none:
             yield next_id
-            next_id = nodes_info[next_id].next
+            next_id = next_ids[next_id]
 
     def __len__(self):
-        return len([*self])
+        return sum(1 for _ in self)
 
     def __getattr__(self, name):
-        res = None
-        name = name.encode()
-        for i, item in self._items():
-            if name == item.name:
-                if res is not None:
-                    raise AttributeError(name)
-                res = i
-        if res is None:
+        ids = self._save.nodes_info.child_ids(
+            self._node_id, name.encode()
+        )
+        if len(ids) != 1:
             raise AttributeError(name)
-        return NodeDirectory(self._save, res)
+        return self._save.directory(ids[0])
 
     def __getitem__(self, key):
         if isinstance(key, str):
@@ -187,15 +307,8 @@ class NodeDirectory:
         elif not isinstance(key, bytes):
             raise TypeError
         else:
-            res = None
-            for i, item in self._items():
-                if key == item.name:
-                    if res is not None:
-                        raise AttributeError(name)
-                    res = i
-        if res is None:
-            raise KeyError(key)
-        return NodeDirectory(self._save, res)
+            res = self._lookup(key)
+        return self._save.directory(res)
 
     def __enter__(self):
         save = self._save
@@ -217,57 +330,50 @@ class NodeDirectory:
         if excinfo[0] is not None:
             return
         save = self._save
+        nodes_info = save.nodes_info
         myinfo = self._address
-        nodes_info = list(save.nodes_info)
         if myinfo:
-            myinfo = nodes_info[myinfo[-1]]
+            node_id = myinfo[-1]
+            myinfo = nodes_info[node_id]
             offset = myinfo.offset
             size = myinfo.size
+            resizable = myinfo.child is None
         else:
             offset = save.nodes_data_offset
             size = len(save.data) - offset
+            resizable = not nodes_info
         ctx = bytes(ctx)
-        if len(ctx) != size:
-            r = range(offset + 1, offset + size)
-            for i, info in enumerate(nodes_info):
-                if offset in r or (info.offset + info.size) in r:
-                    raise Exception("could not resize this node")
-                elif offset >= offset + size:
-                    nodes_info[i] = info._replace(
-                        offset=info.offset + len(ctx) - size
-                    )
-                elif info.offset + info.size >= offset + size:
-                    nodes_info[i] = info._replace(
-                        size=info.size + len(ctx) - size
-                    )
+        if len(ctx) != size and not resizable:
+            raise Exception("could not resize this node")
         save.data[offset : offset + size] = ctx
-        if len(ctx) != size:
-            save.nodes_info = tuple(nodes_info)
+        if len(ctx) != size and myinfo:
+            nodes_info.resize(node_id, len(ctx))
 
-    def _items(self):
+    def _lookup(self, path):
         nodes_info = self._save.nodes_info
-        next_id = self._node_id
-        next_id = 0 if next_id is None else nodes_info[next_id].child
-        while next_id is not None:
-            info = nodes_info[next_id]
-            yield next_id, info
-            next_id = info.next
+        paths = nodes_info.paths
+        key = self._node_id, path
+        res = paths.get(key)
+        if res is None:
+            res = self._node_id
+            ids = nodes_info.child_ids(res, path)
+            names = [path] if ids else path.split(b"/")
+            for name in names:
+                ids = nodes_info.child_ids(res, name)
+                if len(ids) > 1:
+                    raise AttributeError(name)
+                if not ids:
+                    raise KeyError(path)
+                res = ids[0]
+            paths[key] = res
+        return res
 
     @property
     def _address(self):
-        child = self._node_id
-        if child is None:
+        node_id = self._node_id
+        if node_id is None:
             return ()
-        res = [child]
-        nodes_info = self._save.nodes_info
-        for i in range(child - 1, -1, -1):
-            node_info = nodes_info[i]
-            if node_info.next == child:
-                child = i
-            elif node_info.child == child:
-                res.append(i)
-                child = i
-        return tuple(reversed(res))
+        return self._save.nodes_info.address(node_id)
 
 
 class SaveFileSummary(NamedTuple):
@@ -281,10 +387,159 @@ class SaveFileSummary(NamedTuple):
         return "%s (version: %g)" % (self.name, self.version / 1000)
 
 
+class FieldEdit(NamedTuple):
+    node: str
+    attrs: tuple
+    value: object
+
+    def __str__(self):
+        return "%s:%s=%r" % (
+            self.node,
+            ".".join(self.attrs),
+            self.value,
+        )
+
+    @classmethod
+    def parse(cls, text):
+        target, sep, value = text.partition("=")
+        node, sep2, attrs = target.partition(":")
+        attrs = tuple(attrs.split("."))
+        if not sep or not sep2 or not node or not all(attrs):
+            raise ValueError("expected NODE:FIELD[.FIELD...]=VALUE")
+        try:
+            value = literal_eval(value)
+        except (SyntaxError, ValueError):
+            pass
+        return cls(node, attrs, value)
+
+    def apply(self, save, dry_run=False):
+        directory = save.nodes[self.node]
+        with directory as obj:
+            for name in self.attrs[:-1]:
+                obj = getattr(obj, name)
+            old = getattr(obj, self.attrs[-1])
+            if old != self.value and not dry_run:
+                setattr(obj, self.attrs[-1], self.value)
+        return old
+
+
+class BatchEditResult(NamedTuple):
+    path: Path
+    ok: bool
+    elapsed: float
+    changes: list
+    error: str = None
+
+    def __str__(self):
+        if not self.ok:
+            return "%s: FAILED in %.3fs: %s" % (
+                self.path,
+                self.elapsed,
+                self.error,
+            )
+        res = "%s: OK in %.3fs" % (self.path, self.elapsed)
+        for edit, old in self.changes:
+            res += "\n    %s (was %r)" % (edit, old)
+        if not self.changes:
+            res += ", nothing to change"
+        return res
+
+
+def _batch_edit(path, edits, dry_run):
+    start = perf_counter()
+    try:
+        changes = SaveFile(path).edit(edits, dry_run)
+    except Exception as e:
+        return BatchEditResult(
+            path,
+            False,
+            perf_counter() - start,
+            [],
+            "%s: %s" % (type(e).__name__, e),
+        )
+    return BatchEditResult(path, True, perf_counter() - start, changes)
+
+
+def _raw_chunk(chunk):
+    if isinstance(chunk, LZ4DataChunkView):
+        chunk = chunk.view
+    return bytes(chunk)
+
+
+def _subtract_ranges(ranges, other):
+    merged = []
+    for start, end in sorted(other):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    res = []
+    i = 0
+    for start, end in ranges:
+        while i < len(merged) and merged[i][1] <= start:
+            i += 1
+        j = i
+        while j < len(merged) and merged[j][0] < end:
+            if merged[j][0] > start:
+                res.append((start, merged[j][0]))
+            start = max(start, merged[j][1])
+            j += 1
+        if start < end:
+            res.append((start, end))
+    return res
+
+
+class FieldLocation(NamedTuple):
+    node: int
+    struct: int
+    field: int = None
+    slice: slice = None
+
+
+class FieldDiff(NamedTuple):
+    path: str
+    struct: str
+    field: str
+    old: object
+    new: object
+
+    def __str__(self):
+        path = self.path
+        if self.struct is None and self.field is not None:
+            path += self.field
+        if self.struct is not None:
+            path += ":" + self.struct
+            if self.field is not None:
+                path += "." + self.field
+        return "%s: %r -> %r" % (path, self.old, self.new)
+
+
+def _json_name(value):
+    if isinstance(value, bytes):
+        return value.decode(errors="backslashreplace")
+    return value
+
+
+def _json_value(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, float) and not isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {_json_name(k): _json_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return list(map(_json_value, value))
+    return value
+
+
 class SaveFile:
     NAME = "sav.dat"
     TMP_NAME = "tmp.dat"
-    BACKUP_NAME = "backup_{}.dat".format
+    BACKUP_DIR = "backups"
+    BACKUP_COUNT = None
+    BACKUP_SIZE = None
+    CACHE_SIZE = 64 << 20
+    PARALLEL_SIZE = 1 << 20
 
     @classmethod
     def resolve_path(cls, path):
@@ -295,21 +550,144 @@ class SaveFile:
             raise Exception
         return path
 
-    def __init__(self, path):
+    def __init__(
+        self,
+        path,
+        workers=None,
+        cache_size=CACHE_SIZE,
+        mmap=False,
+        progress=None,
+    ):
         self.path = self.resolve_path(path)
+        self.workers = workers
+        self.progress = progress
+        self._cache = ChunkCache(self, cache_size)
+        self._mmap = None
+        self._offsets = None
+        self._directories = {}
+        self._field_index = None
+        self._pool = None
+        self.data_chunks = []
+        try:
+            self._read(mmap, progress)
+        except BaseException:
+            if self._mmap is not None:
+                self._unmap()
+            raise
+
+    def _read(self, mmap, progress):
         with (self.path / self.NAME).open("rb") as f:
+            if mmap:
+                f, view = self._map(f)
             self.header = HeaderChunk.read(f)
             self._data_chunks = DataChunkTableChunk.read(f)
-            self.data_chunks = []
             append = self.data_chunks.append
-            for info in self._data_chunks.info:
-                append(DataChunk.read(f, info.comp_len))
+            chunks_info = self._data_chunks.info
+            for i, info in enumerate(chunks_info):
+                if progress is not None:
+                    progress(i, len(chunks_info))
+                if mmap:
+                    end = info.offset + info.comp_len
+                    append(LZ4DataChunkView(view[info.offset : end]))
+                    f.seek(end)
+                else:
+                    append(DataChunk.read(f, info.comp_len))
             self._nodes_info = NodeTableChunk.read(f)
             self.nodes_info = self._nodes_info.info
             EndChunk.read(f)
             if f.read(1):
                 raise Exception
 
+    def _map(self, f):
+        res = MemoryMap(f.fileno(), 0, access=ACCESS_READ)
+        self._mmap = res, memoryview(res)
+        return self._mmap
+
+    def _unmap(self):
+        res, view = self._mmap
+        chunks = self.data_chunks
+        for i, chunk in enumerate(chunks):
+            if isinstance(chunk, LZ4DataChunkView):
+                new = DataChunk.read(BytesIO(chunk.view), len(chunk))
+                self._cache.rebind(i, chunk, new)
+                chunks[i] = new
+                chunk.release()
+        view.release()
+        try:
+            res.close()
+        except BufferError:
+            raise Exception("could not unmap save file: still in use")
+        self._mmap = None
+
+    def _chunk_offsets(self):
+        res = self._offsets
+        if res is None or len(res) != len(self.data_chunks) + 1:
+            res = [0]
+            for chunk in self.data_chunks:
+                res.append(res[-1] + chunk.uncomp_len)
+            self._offsets = res
+        return res
+
+    def _decompress(self, chunks, workers=None):
+        if workers is None:
+            workers = self.workers
+        if (
+            not workers
+            or workers < 2
+            or len(chunks) < 2
+            or sum(map(len, chunks)) < self.PARALLEL_SIZE
+        ):
+            res = map(attrgetter("data"), chunks)
+        else:
+            pool = self._pool
+            if pool is None or pool[0] != workers:
+                self._close_pool()
+                pool = self._pool = workers, ProcessPoolExecutor(
+                    workers
+                )
+            res = pool[1].map(attrgetter("data"), chunks)
+        progress = self.progress
+        if progress is None:
+            return list(res)
+        data = []
+        for i, item in enumerate(res):
+            progress(i, len(chunks))
+            data.append(item)
+        return data
+
+    def close(self):
+        self._close_pool()
+        if self._mmap is not None:
+            self._unmap()
+
+    def _close_pool(self):
+        pool = self._pool
+        self._pool = None
+        if pool is not None:
+            pool[1].shutdown()
+
+    def __del__(self):
+        if (
+            getattr(self, "_pool", None) is not None
+            or getattr(self, "_mmap", None) is not None
+        ):
+            self.close()
+
+    def decompress_all(self, workers=None):
+        res = self._cache.get(range(len(self.data_chunks)), workers)
+        return list(map(bytes, res))
+
+    @property
+    def nodes_info(self):
+        return self._nodes_table
+
+    @nodes_info.setter
+    def nodes_info(self, value):
+        if not isinstance(value, NodeTable):
+            value = NodeTable(value)
+        self._nodes_table = value
+        self._field_index = None
+
     @property
     def nodes_data_offset(self):
         return len(self.header) + len(self._data_chunks)
@@ -320,7 +698,15 @@ class SaveFile:
 
     @property
     def nodes(self):
-        return NodeDirectory(self)
+        return self.directory(None)
+
+    def directory(self, node_id):
+        res = self._directories.get(node_id)
+        if res is None:
+            res = self._directories[node_id] = NodeDirectory(
+                self, node_id
+            )
+        return res
 
     @classmethod
     def summary(cls, path):
@@ -335,10 +721,479 @@ class SaveFile:
             time=header.time,
         )
 
+    @staticmethod
+    def summary_cache_path():
+        res = environ.get("LOCALAPPDATA") or environ.get(
+            "XDG_CACHE_HOME"
+        )
+        res = Path(res) if res else Path.home() / ".cache"
+        return res / "cp2077save" / "summaries.json"
+
+    @classmethod
+    def scan(cls, path, workers=None, cache=True):
+        path = Path(path).resolve()
+        if cache is True:
+            cache = cls.summary_cache_path()
+        elif cache:
+            cache = Path(cache)
+        items = {}
+        if cache:
+            try:
+                with open(cache, encoding="utf-8") as f:
+                    items = load(f)
+            except (OSError, ValueError):
+                pass
+        res = {}
+        misses = []
+        with scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_dir():
+                        continue
+                    st = stat(join(entry.path, cls.NAME))
+                except OSError:
+                    continue
+                key = [st.st_mtime_ns, st.st_size]
+                item = items.get(entry.path)
+                if item is not None and item[:2] == key:
+                    res[entry.path] = item
+                else:
+                    misses.append((entry.path, key))
+        if misses:
+            with ThreadPoolExecutor(workers) as executor:
+                summaries = executor.map(
+                    cls._scan_item, [item[0] for item in misses]
+                )
+                for (name, key), item in zip(misses, summaries):
+                    res[name] = key + item if item else key
+        stale = [
+            name
+            for name in items
+            if Path(name).parent == path and name not in res
+        ]
+        if cache and (misses or stale):
+            for name in stale:
+                del items[name]
+            items.update(res)
+            try:
+                cache.parent.mkdir(parents=True, exist_ok=True)
+                tmp = cache.with_suffix(".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    dump(items, f)
+                replace(tmp, cache)
+            except OSError:
+                pass
+        return [
+            SaveFileSummary(Path(name).name, Path(name), *item[2:])
+            for name, item in res.items()
+            if len(item) > 2
+        ]
+
+    @classmethod
+    def _scan_item(cls, path):
+        try:
+            item = cls.summary(path)
+        except Exception:
+            return None
+        return [item.version, item.date, item.time]
+
+    @classmethod
+    def backups(cls, path):
+        return BackupStore(cls.resolve_path(path) / cls.BACKUP_DIR)
+
+    @classmethod
+    def restore(cls, path, version=None):
+        path = cls.resolve_path(path)
+        backups = cls.backups(path)
+        if version is None:
+            versions = backups.versions()
+            if not versions:
+                raise Exception("no backups")
+            version = versions[-1]
+        if (path / cls.NAME).exists():
+            backups.add(path / cls.NAME)
+        backups.restore(version, path / cls.NAME)
+        return version
+
+    @classmethod
+    def verify(cls, path):
+        res = []
+        path = cls.resolve_path(path)
+        with (path / cls.NAME).open("rb") as f:
+            try:
+                header = HeaderChunk.read(f)
+            except Exception as e:
+                return ["header: %s" % (str(e) or type(e).__name__)]
+            try:
+                table = DataChunkTableChunk.read(f)
+                if table.count > table.capacity:
+                    raise Exception(
+                        "%d chunk(s) but capacity %d"
+                        % (table.count, table.capacity)
+                    )
+                chunks_info = table.info
+            except Exception as e:
+                return [
+                    "chunk table: %s" % (str(e) or type(e).__name__)
+                ]
+            if not header.is_ok:
+                res.append("header: invalid date or time")
+            if not table.is_ok:
+                res.append("chunk table: invalid capacity")
+            total = offset = len(header) + len(table)
+            for i, info in enumerate(chunks_info):
+                if info.offset != offset:
+                    res.append(
+                        "chunk %d: offset %d, expected %d"
+                        % (i, info.offset, offset)
+                    )
+                try:
+                    chunk = DataChunk.read(f, info.comp_len)
+                except Exception:
+                    res.append("chunk %d: truncated or bad magic" % i)
+                    return res
+                if chunk.uncomp_len != info.uncomp_len:
+                    res.append(
+                        "chunk %d: size %d, expected %d"
+                        % (i, chunk.uncomp_len, info.uncomp_len)
+                    )
+                if not chunk.is_ok:
+                    res.append("chunk %d: corrupted LZ4 block" % i)
+                offset += info.comp_len
+                total += info.uncomp_len
+                del chunk
+            try:
+                nodes = NodeTableChunk.read(f)
+                nodes_info = nodes.info
+                EndChunk.read(f)
+            except Exception as e:
+                res.append(
+                    "node table: %s" % (str(e) or type(e).__name__)
+                )
+                return res
+            if nodes.offset != offset:
+                res.append(
+                    "node table: offset %d, expected %d"
+                    % (nodes.offset, offset)
+                )
+            if f.read(1):
+                res.append("trailing data after end chunk")
+        start = len(header) + len(table)
+        count = len(nodes_info)
+        for i, info in enumerate(nodes_info):
+            end = info.offset + info.size
+            if info.offset < start or end > total:
+                res.append(
+                    "node %d: range %d..%d is outside %d..%d"
+                    % (i, info.offset, end, start, total)
+                )
+            for link in info.next, info.child:
+                if link is not None and not 0 <= link < count:
+                    res.append(
+                        "node %d: link to missing node %d" % (i, link)
+                    )
+            child = info.child
+            seen = set()
+            while child is not None and 0 <= child < count:
+                if child in seen:
+                    res.append("node %d: cyclic sibling chain" % i)
+                    break
+                seen.add(child)
+                item = nodes_info[child]
+                if (
+                    item.offset < info.offset
+                    or item.offset + item.size > end
+                ):
+                    res.append(
+                        "node %d: not inside its parent %d" % (child, i)
+                    )
+                if (child := item.next) is not None and child <= i:
+                    break
+        return res
+
+    def export(self, raw=False):
+        nodes_info = self.nodes_info
+        data = self.data
+        for i in range(len(nodes_info)):
+            info = nodes_info[i]
+            path = nodes_info.node_path(i)
+            res = {"id": i, "path": _json_name(b"/".join(path))}
+            res.update(_json_value(info._asdict()))
+            res["name"] = _json_name(info.name)
+            if info.child is None:
+                node = data[info.offset : info.offset + info.size]
+                try:
+                    node = parse_node(node, path)
+                    if isinstance(node, StructListNode):
+                        res["structs"] = [
+                            {
+                                "name": _json_name(item._name),
+                                "fields": _json_value(item.to_dict()),
+                            }
+                            for item in node
+                        ]
+                    elif raw:
+                        res["data"] = bytes(node).hex()
+                except Exception as e:
+                    res["error"] = "%s: %s" % (type(e).__name__, e)
+                del node
+            yield res
+
+    def export_ndjson(self, stream, raw=False):
+        for item in self.export(raw):
+            stream.write(dumps(item, allow_nan=False) + "\n")
+
+    def find(self, name):
+        if isinstance(name, bytes):
+            try:
+                name = name.decode()
+            except Exception:
+                pass
+        if self._field_index is None:
+            self._field_index = self._build_index()
+        return list(self._field_index.get(name, ()))
+
+    def get(self, location):
+        nodes_info = self.nodes_info
+        info = nodes_info[location.node]
+        node = parse_node(
+            self.data[info.offset : info.offset + info.size],
+            nodes_info.node_path(location.node),
+        )
+        res = node[location.struct]
+        if location.field is not None:
+            res = res[location.field]
+        return res
+
+    def _build_index(self):
+        nodes_info = self.nodes_info
+        data = self.data
+        res = {}
+        for i in range(len(nodes_info)):
+            info = nodes_info[i]
+            if info.child is not None:
+                continue
+            try:
+                node = parse_node(
+                    data[info.offset : info.offset + info.size],
+                    nodes_info.node_path(i),
+                )
+            except Exception:
+                continue
+            if not isinstance(node, StructListNode):
+                continue
+            for j, item in enumerate(node):
+                res.setdefault(item._name, []).append(
+                    FieldLocation(i, j)
+                )
+                for k, (name, _, slc) in enumerate(
+                    item._field_table()[0]
+                ):
+                    loc = FieldLocation(i, j, k, slc)
+                    res.setdefault(name, []).append(loc)
+        return res
+
+    DIFF_BLOCK = 1024
+
+    def diff(self, other):
+        self._cache.flush()
+        other._cache.flush()
+        res = []
+        a_info, b_info = self.nodes_info, other.nodes_info
+        a_ids, b_ids = self._node_keys(), other._node_keys()
+        for key, i in a_ids.items():
+            if key not in b_ids:
+                size = a_info[i].size
+                res.append(FieldDiff(key[0], None, None, size, None))
+        for key, j in b_ids.items():
+            if key not in a_ids:
+                size = b_info[j].size
+                res.append(FieldDiff(key[0], None, None, None, size))
+        changed = self._diff_ranges(other)
+        starts = [item[0] for item in changed]
+        a_base, b_base = self.nodes_data_offset, other.nodes_data_offset
+
+        def touched(start, end):
+            i = bisect_right(starts, start) - 1
+            if i >= 0 and changed[i][1] > start:
+                return True
+            i += 1
+            return i < len(starts) and starts[i] < end
+
+        covered = []
+        for key, i in a_ids.items():
+            j = b_ids.get(key)
+            if j is None:
+                continue
+            a, b = a_info[i], b_info[j]
+            if a.child is not None or b.child is not None:
+                continue
+            a_start, b_start = a.offset - a_base, b.offset - b_base
+            covered.append((a_start, a_start + a.size))
+            covered.append((b_start, b_start + b.size))
+            if (
+                a_start == b_start
+                and a.size == b.size
+                and not touched(a_start, a_start + a.size)
+            ):
+                continue
+            a = self.data[a.offset : a.offset + a.size]
+            b = other.data[b.offset : b.offset + b.size]
+            if a != b:
+                res.extend(self._diff_node(key[0], key[2], a, b))
+        for start, end in _subtract_ranges(changed, covered):
+            a = self.data[a_base + start : a_base + end]
+            b = other.data[b_base + start : b_base + end]
+            if a == b:
+                continue
+            n = 0
+            while n < min(len(a), len(b)) and a[n] == b[n]:
+                n += 1
+            m = 0
+            if len(a) == len(b):
+                while a[-1 - m] == b[-1 - m]:
+                    m += 1
+            start += n
+            a, b = a[n : len(a) - m], b[n : len(b) - m]
+            i = self._owner(a_base + start, a_base + start + len(a))
+            if i is None:
+                name, offset = "", a_base
+            else:
+                name = b"/".join(a_info.node_path(i))
+                name = name.decode(errors="backslashreplace")
+                offset = a_info[i].offset
+            start += a_base - offset
+            field = "[%d:%d]" % (start, start + len(a))
+            res.append(FieldDiff(name, None, field, a, b))
+        return res
+
+    def _owner(self, start, end):
+        nodes_info = self.nodes_info
+        depth = nodes_info.parents[1]
+        res = None
+        for i in range(len(nodes_info)):
+            info = nodes_info[i]
+            if info.offset <= start and end <= info.offset + info.size:
+                if res is None or depth[i] > depth[res]:
+                    res = i
+        return res
+
+    def _node_keys(self):
+        nodes_info = self.nodes_info
+        res = {}
+        counts = {}
+        for i in range(len(nodes_info)):
+            path = nodes_info.node_path(i)
+            n = counts[path] = counts.get(path, -1) + 1
+            name = b"/".join(path).decode(errors="backslashreplace")
+            res[name, n, path] = i
+        return res
+
+    def _diff_ranges(self, other):
+        a_offsets = self._chunk_offsets()
+        b_offsets = other._chunk_offsets()
+        a_chunks, b_chunks = self.data_chunks, other.data_chunks
+        block = self.DIFF_BLOCK
+        res = []
+        for i in range(max(len(a_chunks), len(b_chunks))):
+            if i >= len(a_chunks) or i >= len(b_chunks):
+                offsets = a_offsets if i < len(a_chunks) else b_offsets
+                res.append((offsets[i], offsets[i + 1]))
+                continue
+            start = a_offsets[i]
+            end = a_offsets[i + 1]
+            if start != b_offsets[i] or end != b_offsets[i + 1]:
+                res.append(
+                    (
+                        min(start, b_offsets[i]),
+                        max(end, b_offsets[i + 1]),
+                    )
+                )
+                continue
+            if _raw_chunk(a_chunks[i]) == _raw_chunk(b_chunks[i]):
+                continue
+            a = self._cache.get([i])[0]
+            b = other._cache.get([i])[0]
+            for pos in range(0, len(a), block):
+                if a[pos : pos + block] != b[pos : pos + block]:
+                    pos += start
+                    if res and res[-1][1] == pos:
+                        res[-1] = res[-1][0], min(pos + block, end)
+                    else:
+                        res.append((pos, min(pos + block, end)))
+        return res
+
+    @staticmethod
+    def _diff_node(name, path, a, b):
+        a = parse_node(a, path)
+        b = parse_node(b, path)
+        if not isinstance(a, StructListNode) or not isinstance(
+            b, StructListNode
+        ):
+            return [FieldDiff(name, None, None, len(a), len(b))]
+        res = []
+        a_items, b_items = {}, {}
+        for node, items in (a, a_items), (b, b_items):
+            counts = {}
+            for item in node:
+                n = counts[item._name] = counts.get(item._name, -1) + 1
+                items[item._name, n] = item
+        for key in chain(
+            a_items, [k for k in b_items if k not in a_items]
+        ):
+            struct = _json_name(key[0])
+            a, b = a_items.get(key), b_items.get(key)
+            if a is None or b is None:
+                a = None if a is None else a.to_dict()
+                b = None if b is None else b.to_dict()
+                res.append(FieldDiff(name, struct, None, a, b))
+            elif bytes(a) != bytes(b):
+                a, b = a.to_dict(), b.to_dict()
+                for field in chain(a, [k for k in b if k not in a]):
+                    if a.get(field) != b.get(field):
+                        res.append(
+                            FieldDiff(
+                                name,
+                                struct,
+                                _json_name(field),
+                                a.get(field),
+                                b.get(field),
+                            )
+                        )
+        return res
+
+    def edit(self, edits, dry_run=False):
+        changes = []
+        for edit in edits:
+            old = edit.apply(self, dry_run)
+            if old != edit.value:
+                changes.append((edit, old))
+        if changes and not dry_run:
+            self.save()
+        return changes
+
+    @classmethod
+    def batch_edit(cls, paths, edits, dry_run=False, workers=None):
+        paths = list(paths)
+        if workers == 1 or len(paths) < 2:
+            for path in paths:
+                yield _batch_edit(path, edits, dry_run)
+            return
+        workers = min(workers or len(paths), len(paths))
+        with ProcessPoolExecutor(workers) as pool:
+            yield from pool.map(
+                _batch_edit,
+                paths,
+                [edits] * len(paths),
+                [dry_run] * len(paths),
+            )
+
     def save(self, path=None):
         if path is not None:
             self.path = self.resolve_path(path)
         path = self.path
+        self._cache.flush()
+        self._close_pool()
         offset = self.nodes_data_offset
         info = []
         for chunk in self.data_chunks:
@@ -356,16 +1211,155 @@ class SaveFile:
             f.write(self.header)
             f.write(self._data_chunks)
             for chunk in self.data_chunks:
+                if isinstance(chunk, LZ4DataChunkView):
+                    chunk = chunk.view
                 f.write(chunk)
             f.write(self._nodes_info)
             f.write(EndChunk())
-        backup = 0
-        while (path / self.BACKUP_NAME(backup + 1)).exists():
-            backup += 1
-        for backup in range(backup, -1, -1):
-            if backup:
-                old = path / self.BACKUP_NAME(backup)
+        mapped = self._mmap is not None
+        if mapped:
+            self._unmap()
+        if (path / self.NAME).exists():
+            backups = self.backups(path)
+            backups.add(path / self.NAME)
+            if (
+                self.BACKUP_COUNT is not None
+                or self.BACKUP_SIZE is not None
+            ):
+                backups.prune(self.BACKUP_COUNT, self.BACKUP_SIZE)
+        replace(path / self.TMP_NAME, path / self.NAME)
+        if mapped:
+            with (path / self.NAME).open("rb") as f:
+                view = self._map(f)[1]
+            chunks = self.data_chunks
+            for i, item in enumerate(info):
+                end = item.offset + item.comp_len
+                chunk = LZ4DataChunkView(view[item.offset : end])
+                self._cache.rebind(i, chunks[i], chunk)
+                chunks[i] = chunk
+
+
+def main(args=None):
+    parser = ArgumentParser(
+        description="Cyberpunk 2077 save file tools."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    cmd = commands.add_parser(
+        "verify", help="check save file structure"
+    )
+    cmd.add_argument("path", nargs="+", type=Path)
+    cmd = commands.add_parser(
+        "edit", help="change fields in many save files"
+    )
+    cmd.add_argument(
+        "path",
+        nargs="+",
+        type=Path,
+        help="save directories, or folders containing them",
+    )
+    cmd.add_argument(
+        "-s",
+        "--set",
+        action="append",
+        required=True,
+        type=FieldEdit.parse,
+        metavar="NODE:FIELD=VALUE",
+        dest="edits",
+        help="field to change, e.g. "
+        "ScriptableSystemsContainer:DataTrackingSystem.failedShardDrops=0",
+    )
+    cmd.add_argument(
+        "-m", "--match", help="only edit saves whose name matches"
+    )
+    cmd.add_argument(
+        "-n",
+        "--dry-run",
+        action="store_true",
+        help="show changes without saving",
+    )
+    cmd.add_argument("-j", "--workers", type=int)
+    cmd = commands.add_parser(
+        "diff", help="show changed fields between two saves"
+    )
+    cmd.add_argument("old", type=Path)
+    cmd.add_argument("new", type=Path)
+    cmd = commands.add_parser(
+        "export", help="write the node tree as NDJSON"
+    )
+    cmd.add_argument("path", type=Path)
+    cmd.add_argument(
+        "-o", "--output", type=Path, help="output file (default stdout)"
+    )
+    cmd.add_argument(
+        "-r",
+        "--raw",
+        action="store_true",
+        help="include other leaf node data as hex",
+    )
+    cmd = commands.add_parser(
+        "restore", help="restore a save file from its backups"
+    )
+    cmd.add_argument("path", type=Path)
+    cmd.add_argument("version", nargs="?", type=int)
+    cmd.add_argument(
+        "-l", "--list", action="store_true", help="list backups"
+    )
+    args = parser.parse_args(args)
+    status = 0
+    if args.command == "verify":
+        for path in args.path:
+            try:
+                res = SaveFile.verify(path)
+            except Exception as e:
+                res = [str(e) or type(e).__name__]
+            status |= bool(res)
+            if not res:
+                print("%s: OK" % path)
+                continue
+            print("%s: %d problem(s)" % (path, len(res)))
+            for item in res[:10]:
+                print("    " + item)
+            if len(res) > 10:
+                print("    ...")
+    elif args.command == "edit":
+        paths = []
+        for path in args.path:
+            if (path / SaveFile.NAME).is_file():
+                paths.append(path)
             else:
-                old = path / self.NAME
-            old.rename(path / self.BACKUP_NAME(backup + 1))
-        (path / self.TMP_NAME).rename(path / self.NAME)
+                paths.extend(
+                    sorted(item.path for item in SaveFile.scan(path))
+                )
+        if args.match:
+            paths = [i for i in paths if fnmatch(i.name, args.match)]
+        for res in SaveFile.batch_edit(
+            paths, args.edits, args.dry_run, args.workers
+        ):
+            status |= not res.ok
+            print(res)
+        if args.dry_run:
+            print("dry run, nothing was saved")
+    elif args.command == "diff":
+        for item in SaveFile(args.old).diff(SaveFile(args.new)):
+            status = 1
+            print(item)
+    elif args.command == "export":
+        save = SaveFile(args.path)
+        if args.output is None:
+            save.export_ndjson(stdout, args.raw)
+        else:
+            with args.output.open("w", encoding="utf-8") as f:
+                save.export_ndjson(f, args.raw)
+    elif args.command == "restore" and args.list:
+        backups = SaveFile.backups(args.path)
+        for version in backups.versions():
+            size = backups.manifest(version)["size"]
+            print("%d: %d bytes" % (version, size))
+    elif args.command == "restore":
+        version = SaveFile.restore(args.path, args.version)
+        print("%s: restored backup %d" % (args.path, version))
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -15,11 +15,12 @@ ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
 OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 """
 
-from struct import Struct, unpack
+from struct import Struct, pack, unpack
 
 
 class Type:
     BY_NAME = {}
+    CACHE = {}
 
     def __init__(self, name=None):
         if name != getattr(self, "name", None):
@@ -34,6 +35,13 @@ class Type:
     def __repr__(self):
         return getattr(self, "name", None) or "GenericType"
 
+    @staticmethod
+    def cached(name):
+        res = __class__.CACHE.get(name)
+        if res is None:
+            res = __class__.CACHE[name] = Type(name)
+        return res
+
     def __init_subclass__(cls, name=None, **kwargs):
         super().__init_subclass__(**kwargs)
         if name:
@@ -42,31 +50,63 @@ class Type:
     from_bytes = to_bytes = bytes
 
 
+class Scalar(Type):
+    def __init_subclass__(cls, fmt=None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if fmt:
+            cls.fmt = fmt
+            cls.struct = Struct("<" + fmt)
+            cls.size = cls.struct.size
+
+    @classmethod
+    def from_bytes(cls, value):
+        return cls.struct.unpack(value)[0]
+
+    @classmethod
+    def to_bytes(cls, value):
+        return cls.struct.pack(value)
+
+    def from_array(self, value, count):
+        return unpack("<%d%s" % (count, self.fmt), value)
+
+    def to_array(self, value):
+        return pack("<%d%s" % (len(value), self.fmt), *value)
+
+
 class Array(Type, name="array"):
     def __init__(self, name):
         super().__init__(name)
-        self.item = Type(name.split(":", 1)[1])
+        self.item = Type.cached(name.split(":", 1)[1])
 
     def from_bytes(self, value):
         if len(value) < 4:
             raise ValueError("too small")
-        res = []
+        count = unpack("<I", value[:4])[0]
         item = self.item
+        if isinstance(item, Scalar):
+            if len(value) != 4 + count * item.size:
+                raise ValueError("array size mismatch: %r" % value)
+            return item.from_array(value[4:], count)
+        res = []
         item_size = item.size
         item = item.from_bytes
         for i in range(4, len(value), item_size):
             res.append(item(value[i : i + item_size]))
-        if len(res) != unpack("<I", value[:4])[0]:
+        if len(res) != count:
             raise ValueError("array size mismatch: %r" % value)
         return tuple(res)
 
     def to_bytes(self, value):
-        return b"".join(map(self.item.to_bytes, value))
-
+        value = tuple(value)
+        item = self.item
+        if isinstance(item, Scalar):
+            return pack("<I", len(value)) + item.to_array(value)
+        return pack("<I", len(value)) + b"".join(
+            map(item.to_bytes, value)
+        )
 
-class Bool(Type, name="Bool"):
-    size = 1
 
+class Bool(Scalar, name="Bool", fmt="B"):
     @staticmethod
     def from_bytes(value):
         if len(value) != 1:
@@ -79,22 +119,46 @@ class Bool(Type, name="Bool"):
     def to_bytes(value):
         return bytes([bool(value)])
 
+    def from_array(self, value, count):
+        if value and max(value) > 1:
+            raise ValueError("bad boolean value: %d" % max(value))
+        return tuple(map(bool, value))
 
-class Int32(Type, name="Int32"):
-    size = 4
+    def to_array(self, value):
+        return bytes(map(bool, value))
 
-    @staticmethod
-    def from_bytes(value):
-        return unpack("<i", value)[0]
 
-    to_bytes = Struct("<i").pack
+class Int8(Scalar, name="Int8", fmt="b"):
+    pass
 
 
-class Float(Type, name="Float"):
-    size = 4
+class Uint8(Scalar, name="Uint8", fmt="B"):
+    pass
+
+
+class Int16(Scalar, name="Int16", fmt="h"):
+    pass
+
+
+class Uint16(Scalar, name="Uint16", fmt="H"):
+    pass
+
+
+class Int32(Scalar, name="Int32", fmt="i"):
+    pass
+
+
+class Uint32(Scalar, name="Uint32", fmt="I"):
+    pass
+
+
+class Int64(Scalar, name="Int64", fmt="q"):
+    pass
+
+
+class Uint64(Scalar, name="Uint64", fmt="Q"):
+    pass
 
-    @staticmethod
-    def from_bytes(value):
-        return unpack("<f", value)[0]
 
-    to_bytes = Struct("<f").pack
+class Float(Scalar, name="Float", fmt="f"):
+    pass